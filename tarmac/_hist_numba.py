@@ -0,0 +1,113 @@
+import numba
+import numpy as np
+
+
+def corner_counts(
+    samples: np.ndarray,
+    lower: np.ndarray,
+    upper: np.ndarray,
+    bins: np.ndarray,
+    rows: np.ndarray,
+    cols: np.ndarray,
+) -> list[np.ndarray]:
+    """Count the samples falling in each bin of every corner plot histogram.
+
+    Each parameter is binned once, in parallel over the samples. The
+    histograms of the requested pairs of parameters are then filled in
+    parallel, with each thread counting into its own histogram so that
+    no atomic updates are needed. If there are fewer pairs than threads,
+    the samples are split into chunks so that every thread has work.
+
+    Parameters
+    ----------
+    samples : np.ndarray
+        Samples of shape (nsamples, ndim)
+    lower : np.ndarray
+        Lower bound of the histogram range of each parameter
+    upper : np.ndarray
+        Upper bound of the histogram range of each parameter
+    bins : np.ndarray
+        Number of bins for each parameter
+    rows : np.ndarray
+        Parameter binned along the first dimension of each histogram
+    cols : np.ndarray
+        Parameter binned along the second dimension of each histogram
+
+    Returns
+    -------
+    list[np.ndarray]
+        Counts of each histogram p, of shape (bins[rows[p]], bins[cols[p]]).
+        If rows[p] == cols[p], it is the 1D histogram of that parameter, of
+        shape (bins[rows[p]],).
+    """
+    # Each histogram is stored at its own size in one flat buffer, rather than
+    # padding them all to the largest number of bins.
+    shapes = [
+        (bins[row],) if row == col else (bins[row], bins[col])
+        for row, col in zip(rows, cols, strict=True)
+    ]
+    offsets = np.zeros(len(shapes) + 1, dtype=np.int64)
+    np.cumsum([np.prod(shape) for shape in shapes], out=offsets[1:])
+
+    nchunks = max(1, min(-(-numba.get_num_threads() // len(rows)), len(samples)))
+    counts = _corner_counts(samples, lower, upper, bins, rows, cols, offsets, nchunks)
+    return [
+        counts[start:stop].reshape(shape)
+        for start, stop, shape in zip(offsets[:-1], offsets[1:], shapes, strict=True)
+    ]
+
+
+@numba.njit(parallel=True, cache=True)
+def _corner_counts(
+    samples: np.ndarray,
+    lower: np.ndarray,
+    upper: np.ndarray,
+    bins: np.ndarray,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    offsets: np.ndarray,
+    nchunks: int,
+) -> np.ndarray:
+    """Fill the histograms for `corner_counts`, splitting the samples into nchunks.
+
+    Histogram p is stored row-major in counts[offsets[p]:offsets[p + 1]].
+    """
+    nsamples, ndim = samples.shape
+
+    # Like np.histogram, the last bin includes the upper bound. Samples outside
+    # of the bounds (or NaN) are assigned the index -1 and aren't counted.
+    indices = np.empty((ndim, nsamples), dtype=np.int32)
+    for k in range(ndim):
+        scale = bins[k] / (upper[k] - lower[k])
+        for n in numba.prange(nsamples):
+            x = samples[n, k]
+            if x >= lower[k] and x <= upper[k]:
+                indices[k, n] = min(int((x - lower[k]) * scale), bins[k] - 1)
+            else:
+                indices[k, n] = -1
+
+    # Each chunk of samples is counted into a private copy of the histograms,
+    # one pair at a time per thread, so no two threads write to the same bins.
+    # The copies are summed at the end.
+    npairs = len(rows)
+    chunk = -(-nsamples // nchunks)
+    private = np.zeros((nchunks, offsets[-1]), dtype=np.int64)
+    for task in numba.prange(nchunks * npairs):
+        # prange indices are unsigned, so cast them before mixing with int64
+        c, p = divmod(np.int64(task), npairs)
+        row = indices[rows[p]]
+        col = indices[cols[p]]
+        hist = private[c, offsets[p] : offsets[p + 1]]
+
+        start, stop = c * chunk, min((c + 1) * chunk, nsamples)
+        if rows[p] == cols[p]:
+            for n in range(start, stop):
+                if row[n] >= 0:
+                    hist[row[n]] += 1
+        else:
+            ncols = bins[cols[p]]
+            for n in range(start, stop):
+                if row[n] >= 0 and col[n] >= 0:
+                    hist[row[n] * ncols + col[n]] += 1
+
+    return private.sum(axis=0)
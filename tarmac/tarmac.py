@@ -1,15 +1,47 @@
+import importlib.util
+import os
 from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 
 import matplotlib.colors as colors
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 import numpy as np
+from matplotlib.collections import LineCollection
+
+try:
+    from fast_histogram import histogram1d, histogram2d
+except ImportError:
+    histogram1d = histogram2d = None
+
+try:
+    import boost_histogram
+except ImportError:
+    boost_histogram = None
+
+try:
+    import cupy
+except ImportError:
+    cupy = None
+
+# Samples larger than this many bytes are histogrammed on the GPU by default if
+# cupy is installed. Smaller inputs aren't worth the cost of the transfer.
+_CUPY_MIN_BYTES = 200 * 2**20
+
+# numba is slow to import and compiles its kernel the first time it's used, so
+# it is only imported when needed and only picked by default for samples larger
+# than this many bytes, where the faster histograms make up for it.
+_NUMBA_MIN_BYTES = 100 * 2**20
 
 
 def _label_offset(ax: plt.Axes, axis: str = "y") -> None:
     """Move ticklabel offsets (e.g. exponents) to the axis label.
 
-    The label is dynamically updated when the axis range changes.
+    The label is dynamically updated when the axis range changes. Axes which
+    don't lie at the edge of the subplot grid don't display a label, so only
+    their offset text is hidden and no callback is connected. Outer axes
+    without a label still get one, since the offset is needed to read the
+    tick labels.
 
     Parameters
     ----------
@@ -18,31 +50,40 @@ def _label_offset(ax: plt.Axes, axis: str = "y") -> None:
     axis : str
         Axis to label of the offset on; can be 'x' or 'y'
     """
+    subplotspec = ax.get_subplotspec()
     if axis == "y":
-        fmt = ax.yaxis.get_major_formatter()
-        ax.yaxis.offsetText.set_visible(False)
+        tick_axis = ax.yaxis
         labelfunc = ax.set_ylabel
         label = ax.get_ylabel()
+        outer = subplotspec is None or subplotspec.is_first_col()
 
     elif axis == "x":
-        fmt = ax.xaxis.get_major_formatter()
-        ax.xaxis.offsetText.set_visible(False)
+        tick_axis = ax.xaxis
         labelfunc = ax.set_xlabel
         label = ax.get_xlabel()
+        outer = subplotspec is None or subplotspec.is_last_row()
+
+    fmt = tick_axis.get_major_formatter()
+    tick_axis.offsetText.set_visible(False)
+    if not outer:
+        return
 
     def update_label(_ax: plt.Axes) -> None:
+        # The formatter only computes the offset when the ticks are drawn;
+        # compute it directly rather than drawing the whole canvas. Shared axes
+        # share their formatter, which reads the view limits of whichever axis
+        # it was last attached to. This callback runs before the other shared
+        # axes are updated, so point the formatter back at this axis first.
+        fmt.set_axis(tick_axis)
+        fmt.set_locs(tick_axis.get_majorticklocs())
         offset = fmt.get_offset()
         if offset == "":
             labelfunc(f"{label}")
         else:
             labelfunc(f"{label} ({offset})")
 
-        # Only display labels on axes which lie at the edge of the subplot grid
-        ax.label_outer()
-
-    ax.callbacks.connect("ylim_changed", update_label)
-    ax.callbacks.connect("xlim_changed", update_label)
-    ax.figure.canvas.draw()
+    # Only the limits of this axis change its ticks and offset
+    ax.callbacks.connect(f"{axis}lim_changed", update_label)
     update_label(None)
 
 
@@ -57,6 +98,9 @@ def corner_plot(
     facecolor: str = "C0",
     edgecolor: str | None = None,
     density: bool = True,
+    backend: str | None = None,
+    shared_norm: bool = False,
+    max_samples: int | None = None,
 ) -> None:
     """Generate a corner plot.
 
@@ -69,9 +113,15 @@ def corner_plot(
     fig : plt.Figure
         Matplotlib figure in which to draw the corner plot; should be empty
     samples : np.ndarray
-        MCMC samples of shape (nsamples, nwalkers, ndim).
+        MCMC samples of shape (nsamples, nwalkers, ndim). The histograms read
+        the samples of one parameter at a time, so Fortran-ordered (column
+        major) samples are used as-is, while other layouts are copied first.
+        In particular, samples saved in Fortran order with np.save can be
+        loaded with np.load(..., mmap_mode="r") and plotted without reading
+        them into memory up front.
     bins : int | Sequence[int]
-        Number of bins along each axis of each histogram.
+        Number of bins along each axis of each histogram, or a list of the
+        number of bins for each model parameter.
     ranges : Iterable[tuple[float, float]] | None
         A list of bounds (min, max) for each histogram plot. (the default
         is None, which automatically chooses 3*sigma bounds about the mean.)
@@ -88,117 +138,273 @@ def corner_plot(
         Edgecolor to use for the 1D histograms
     density : bool
         If True, the density is plotted
+    backend : str | None
+        Library used to compute the histograms; one of ['numba',
+        'boost-histogram', 'fast-histogram', 'cupy', 'numpy']. numpy is always
+        available; the others must be installed separately. (the default is
+        None, which picks the fastest one that is installed. cupy is only
+        picked for samples larger than 200 MB, which are worth copying to the
+        GPU, and numba for samples larger than 100 MB, which are worth its
+        import and compilation time.)
+    shared_norm : bool
+        If True, the 2D histograms all use the same color scale, from 0 to the
+        largest value in any of them, so that colors can be compared between
+        subplots. Otherwise each is scaled to its own maximum. Only used if
+        plot_type is 'hist'.
+    max_samples : int | None
+        If given, at most this many samples are plotted. Larger inputs are
+        thinned by keeping every n-th step of every walker, which is usually
+        visually indistinguishable for large MCMC runs but much faster to
+        histogram. At least one step is always kept. (the default is None,
+        which plots all samples.)
     """
-    if len(np.shape(samples)) != 3:
-        raise ValueError(
-            f"Samples must be of shape (nsamples, nwalkers, ndim), not {np.shape(samples)}"
-        )
-
-    nsamples, _nwalkers, ndim = np.shape(samples)
-    samples = samples.reshape((-1, ndim))
-
-    if nsamples <= ndim:
-        raise ValueError(
-            "Number of samples <= number of dimensions. Is this intended for this dataset?"
-        )
-
-    if isinstance(bins, int):
-        bins_arr = np.array([bins for _ in range(ndim)])
-    else:
-        raise ValueError(f"Invalid type {type(bins)} for parameter 'bins'.")
-
-    if ranges is None:
-        ranges = [_nice_bounds(samples[:, i]) for i in range(ndim)]
-    elif len(ranges) != ndim:
-        raise ValueError(
-            "Dimension mismatch between ranges and number of columns in samples."
-        )
-    else:
-        ranges = [
-            _nice_bounds(samples[:, i]) if ranges[i] is None else ranges[i]
-            for i in range(ndim)
-        ]
-
-    if labels is None:
-        labels = ["" for _ in range(ndim)]
+    samples, bins_arr, ranges, limits, labels = _validate_corner_args(
+        samples, bins, ranges, labels, max_samples
+    )
+    ndim = samples.shape[1]
+
+    # Divide the figure into a grid of subplots with no whitespace between
+    # them. Only the diagonal and lower triangle are used, so only create those
+    # axes; the x-axis of each column is shared with the diagonal subplot, and
+    # the y-axis of each row of 2D histograms with its first subplot.
+    grid = fig.add_gridspec(
+        ndim,
+        ndim,
+        left=0.1,
+        bottom=0.1,
+        right=0.98,
+        top=0.98,
+        wspace=0.05,
+        hspace=0.05,
+    )
+    axes = np.empty((ndim, ndim), dtype=object)
+    for i in range(ndim):
+        for j in range(i + 1):
+            axes[i, j] = fig.add_subplot(
+                grid[i, j],
+                sharex=axes[j, j] if j < i else None,
+                sharey=axes[i, 0] if 0 < j < i else None,
+            )
 
-    # Divide the figure into a bunch of subplots, and Remove whitespace
-    # between plots
-    axes = fig.subplots(ndim, ndim, sharex="col")
-    fig.subplots_adjust(
-        left=0.1, bottom=0.1, right=0.98, top=0.98, wspace=0.05, hspace=0.05
+    # Shared axes share their tick locator, so it only needs to be set once for
+    # each column (x) and once for each row of 2D histograms (y).
+    for i in range(ndim):
+        axes[i, i].xaxis.set_major_locator(_max_n_locator())
+        if i > 0:
+            axes[i, 0].yaxis.set_major_locator(_max_n_locator())
+
+    pdfs = _histograms(
+        samples,
+        bins=bins_arr,
+        ranges=ranges,
+        density=density,
+        pairs=plot_type in ["hist", "histogram"],
+        backend=backend,
     )
 
+    norm = None
+    if shared_norm and ndim > 1 and plot_type in ["hist", "histogram"]:
+        vmax = max(pdf.max() for (i, j), pdf in pdfs.items() if i != j)
+        norm = colors.Normalize(vmin=0, vmax=vmax)
+
     if ndim == 1:
         _hist_1d(
-            ax=axes,
-            samples=samples[:, 0],
-            bins=bins_arr[0],
+            ax=axes[0, 0],
+            pdf=pdfs[0, 0],
             bounds=ranges[0],
+            xlim=limits[0],
             label=labels[0],
-            density=density,
             facecolor=facecolor,
             edgecolor=edgecolor,
         )
 
     else:
+        # Plot the 1D histograms along the diagonal
         for i in range(ndim):
-            # Plot the 1D histograms along the diagonal. If i == ndim-1,
-            # make xticklabels. Otherwise, omit them.
             _hist_1d(
                 ax=axes[i, i],
-                samples=samples[:, i],
-                bins=bins_arr[i],
+                pdf=pdfs[i, i],
                 bounds=ranges[i],
+                xlim=limits[i],
                 label=labels[i],
                 facecolor=facecolor,
                 edgecolor=edgecolor,
             )
 
-            # Plot the 2D histograms in the lower left corner
-            for j in range(ndim):
-                if j > i:
-                    axes[i, j].axis("off")
-                elif j < i:
-                    _hist_2d(
-                        ax=axes[i, j],
-                        xsamples=samples[:, j],
-                        ysamples=samples[:, i],
-                        xbins=bins_arr[j],
-                        ybins=bins_arr[i],
-                        xbounds=ranges[j],
-                        ybounds=ranges[i],
-                        xlabel=labels[j],
-                        ylabel=labels[i],
-                        cmap=cmap,
-                        plot_type=plot_type,
-                        density=density,
-                        sharey=axes[i, 0],
-                    )
-
-                for tick in axes[i, j].get_xticklabels():
-                    tick.set_rotation(45)
+        # Plot the 2D histograms in the lower left corner
+        for i, j in zip(*np.tril_indices(ndim, -1), strict=True):
+            _hist_2d(
+                ax=axes[i, j],
+                xsamples=samples[:, j],
+                ysamples=samples[:, i],
+                pdf=pdfs.get((i, j)),
+                xbins=bins_arr[j],
+                ybins=bins_arr[i],
+                xbounds=ranges[j],
+                ybounds=ranges[i],
+                xlim=limits[j],
+                ylim=limits[i],
+                xlabel=labels[j],
+                ylabel=labels[i],
+                cmap=cmap,
+                norm=norm,
+                plot_type=plot_type,
+            )
+
+        for ax in axes[np.tril_indices(ndim)]:
+            ax.tick_params(axis="x", labelrotation=45)
+
+    # Only display labels on axes which lie at the edge of the subplot grid
+    for ax in axes[np.tril_indices(ndim)]:
+        ax.label_outer()
+
+
+def _validate_corner_args(
+    samples: np.ndarray,
+    bins: int | Sequence[int],
+    ranges: Sequence[tuple[float, float] | None] | None,
+    labels: Sequence[str] | None,
+    max_samples: int | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, Sequence[str]]:
+    """Check and normalize the arguments of corner_plot.
+
+    Parameters
+    ----------
+    samples : np.ndarray
+        MCMC samples of shape (nsamples, nwalkers, ndim)
+    bins : int | Sequence[int]
+        Number of bins for all parameters, or for each parameter
+    ranges : Sequence[tuple[float, float] | None] | None
+        Histogram range for each parameter; parameters without one use their
+        plot limits
+    labels : Sequence[str] | None
+        Name of each parameter
+    max_samples : int | None
+        Maximum number of samples to keep; if there are more, every n-th step
+        of every walker is kept
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, Sequence[str]]
+        Column-major samples of shape (nsamples*nwalkers, ndim), the number of
+        bins for each parameter, the histogram range and plot limits of each
+        parameter (each of shape (ndim, 2)), and the label of each parameter
+    """
+    samples = np.asarray(samples)
+    if samples.ndim != 3:
+        raise ValueError(
+            f"Samples must be of shape (nsamples, nwalkers, ndim), not {samples.shape}"
+        )
+
+    nsamples, nwalkers, ndim = samples.shape
+    if nsamples <= ndim:
+        raise ValueError(
+            "Number of samples <= number of dimensions. Is this intended for this dataset?"
+        )
+
+    requested = np.asarray(bins)
+    if requested.ndim == 0:
+        requested = np.full(ndim, requested)
+    elif requested.shape != (ndim,):
+        raise ValueError(
+            "Dimension mismatch between bins and number of columns in samples."
+        )
+    if not np.issubdtype(requested.dtype, np.number) or np.any(
+        ~np.isfinite(requested) | (requested < 1) | (requested != np.floor(requested))
+    ):
+        raise ValueError(f"bins must be positive integers, not {bins}")
+    bins = requested.astype(np.intp)
+
+    if labels is None:
+        labels = ["" for _ in range(ndim)]
+    elif len(labels) != ndim:
+        raise ValueError(
+            "Dimension mismatch between labels and number of columns in samples."
+        )
+
+    if ranges is not None and len(ranges) != ndim:
+        raise ValueError(
+            "Dimension mismatch between ranges and number of columns in samples."
+        )
+
+    if max_samples is not None and max_samples < 1:
+        raise ValueError(f"max_samples must be at least 1, not {max_samples}")
+
+    # Thin the samples along the steps before copying them, so that only the
+    # kept ones are read and every walker is still represented
+    if max_samples is not None and nsamples * nwalkers > max_samples:
+        nkept = max(1, max_samples // nwalkers)
+        samples = samples[:: -(-nsamples // nkept)]
+
+    # Store the samples column-major so that each parameter's samples are
+    # contiguous in memory; every histogram and bound below reads one column.
+    # The order of the samples doesn't matter, so flatten them in Fortran
+    # order: this is a view of Fortran-ordered input, and any other layout is
+    # copied straight into column-major order. Only thinned Fortran input is
+    # left strided by the reshape, and is copied by np.asfortranarray instead.
+    samples = np.asfortranarray(np.reshape(samples, (-1, ndim), order="F"))
+
+    # Plot limits for each parameter; these are reused by every subplot in the
+    # parameter's row and column, so compute them all at once.
+    limits = np.column_stack(_nice_bounds(samples))
+
+    # Like np.histogram, widen the empty range of a parameter which is held
+    # constant by 0.5 on either side, so that it can be binned and plotted.
+    # Rounding in the mean can leave its limits a few ulp apart rather than
+    # equal, so check the samples of any parameter with such narrow limits.
+    narrow = np.flatnonzero(
+        limits[:, 1] - limits[:, 0] <= 1000 * np.spacing(np.abs(limits).max(axis=1))
+    )
+    constant = narrow[np.ptp(samples[:, narrow], axis=0) == 0]
+    limits[constant] = limits[constant].mean(axis=1, keepdims=True) + [-0.5, 0.5]
+
+    if ranges is None:
+        ranges = limits
+    else:
+        ranges = np.array(
+            [
+                limit if r is None else r
+                for limit, r in zip(limits, ranges, strict=True)
+            ],
+            dtype=np.float64,
+        )
+        empty = ranges[:, 0] == ranges[:, 1]
+        ranges[empty] += [-0.5, 0.5]
+
+    return samples, bins, ranges, limits, labels
+
+
+def _max_n_locator() -> ticker.MaxNLocator:
+    """Make a tick locator for the corner plot axes.
+
+    Each Axis needs its own locator instance, so one can't be shared at module
+    level.
+
+    Returns
+    -------
+    ticker.MaxNLocator
+        Locator placing at most 5 ticks, without one at the upper limit
+    """
+    return ticker.MaxNLocator(nbins=5, prune="upper")
 
 
 def _hist_1d(
     ax: plt.Axes,
-    samples: np.ndarray,
-    bins: int,
+    pdf: np.ndarray,
     bounds: tuple[float, float],
+    xlim: tuple[float, float],
     label: str,
-    density: bool = True,
     facecolor: str = "C0",
     edgecolor: str | None = None,
 ) -> None:
-    pdf, xedges = np.histogram(samples, bins=bins, range=bounds, density=density)
+    xedges = np.linspace(*bounds, len(pdf) + 1)
     pdf = np.append(pdf, 0)
     ax.fill_between(xedges, pdf, step="post", facecolor=facecolor, edgecolor=edgecolor)
 
-    ax.set_yticklabels([])
-    ax.set_xlim(_nice_bounds(samples))
+    ax.tick_params(axis="y", labelleft=False)
+    ax.set_xlim(xlim)
 
     ax.set_xlabel(label)
-    ax.get_xaxis().set_major_locator(ticker.MaxNLocator(nbins=5, prune="upper"))
     _label_offset(ax, "x")
 
 
@@ -206,37 +412,31 @@ def _hist_2d(
     ax: plt.Axes,
     xsamples: np.ndarray,
     ysamples: np.ndarray,
+    pdf: np.ndarray | None,
     xbins: np.ndarray,
     ybins: np.ndarray,
     xbounds: tuple[float, float],
     ybounds: tuple[float, float],
+    xlim: tuple[float, float],
+    ylim: tuple[float, float],
     xlabel: str,
     ylabel: str,
     cmap: str | colors.Colormap,
+    norm: colors.Normalize | None,
     plot_type: str,
-    density: bool = True,
-    sharey: plt.Axes | None = None,
 ) -> None:
     if plot_type in ["hist", "histogram"]:
-        # matplotlib's ax.hist2d makes a patch for each bin (bug?). Instead, use imshow to make a cleaner, faster plot.
-        #
-        # By default, np.histogram2d histograms x-values along the first dimension of the pdf, and y-values along
-        # the second dimension. This is opposite to how we want to display the data, which is why the x and y values
-        # are swapped here.
-        pdf, yedges, xedges = np.histogram2d(
-            ysamples,
-            xsamples,
-            bins=[ybins, xbins],
-            range=[ybounds, xbounds],
-            density=density,
-        )
-
+        # matplotlib's ax.hist2d recomputes the histogram and draws it as a QuadMesh with a quad for each bin.
+        # The histogram has already been computed, so use imshow to make a cleaner, faster plot.
+        # The image is rasterized so that vector output (svg, pdf) doesn't composite it with the other artists.
         ax.imshow(
             pdf,
             extent=[xbounds[0], xbounds[1], ybounds[0], ybounds[1]],
             cmap=cmap,
+            norm=norm,
             interpolation="nearest",
             origin="lower",
+            rasterized=True,
         )
     elif plot_type in ["hex", "hexbin"]:
         ax.hexbin(
@@ -245,40 +445,376 @@ def _hist_2d(
             gridsize=[int(0.5 * xbins), int(0.5 * ybins)],
             extent=[*xbounds, *ybounds],
             cmap=cmap,
+            rasterized=True,
         )
     else:
         raise ValueError(f"Invalid plot_type: {plot_type}")
 
     ax.set_aspect("auto")
 
-    if sharey is not None:
-        ax.sharey(sharey)
-
     ax.set_xlabel(xlabel)
     ax.set_ylabel(ylabel)
     _label_offset(ax, "x")
     _label_offset(ax, "y")
 
-    ax.get_xaxis().set_major_locator(ticker.MaxNLocator(nbins=5, prune="upper"))
-    ax.get_yaxis().set_major_locator(ticker.MaxNLocator(nbins=5, prune="upper"))
-    ax.set_xlim(_nice_bounds(xsamples))
-    ax.set_ylim(_nice_bounds(ysamples))
-
-    # Only display labels on axes which lie at the edge of the subplot grid
-    ax.label_outer()
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
 
     return
 
 
-def _nice_bounds(samplesx: np.ndarray, factor: float = 3) -> tuple[float, float]:
+def _digitize(
+    samples: np.ndarray, bins: int, bounds: tuple[float, float]
+) -> np.ndarray:
+    """Find the index of the uniform bin that each sample falls in.
+
+    Like np.histogram, the last bin includes the upper bound. Samples outside
+    of the bounds (or NaN) are assigned the index `bins`, i.e. an overflow bin
+    just past the last bin, so that they can be discarded after counting.
+
+    Parameters
+    ----------
+    samples : np.ndarray
+        Samples to bin
+    bins : int
+        Number of bins
+    bounds : tuple[float, float]
+        (min, max) of the histogram range
+
+    Returns
+    -------
+    np.ndarray
+        Bin index of each sample
+    """
+    lower, upper = bounds
+    scaled = (samples - lower) * (bins / (upper - lower))
+    inside = (samples >= lower) & (samples <= upper)
+    return np.where(inside, np.minimum(scaled, bins - 1), bins).astype(np.intp)
+
+
+def _histograms(
+    samples: np.ndarray,
+    bins: Sequence[int],
+    ranges: Sequence[tuple[float, float]],
+    density: bool = True,
+    pairs: bool = True,
+    backend: str | None = None,
+) -> dict[tuple[int, int], np.ndarray]:
+    """Compute the histograms shown in a corner plot.
+
+    Parameters
+    ----------
+    samples : np.ndarray
+        Samples of shape (nsamples, ndim)
+    bins : Sequence[int]
+        Number of bins for each parameter
+    ranges : Sequence[tuple[float, float]]
+        (min, max) of the histogram range for each parameter
+    density : bool
+        If True, normalize each histogram so that it integrates to 1
+    pairs : bool
+        If True, compute the 2D histograms of each pair of parameters in
+        addition to the 1D histogram of each parameter
+    backend : str | None
+        Library used to compute the histograms; one of ['numba',
+        'boost-histogram', 'fast-histogram', 'cupy', 'numpy'] (the default is
+        None, which picks the fastest one that is installed; see
+        `_default_backend`)
+
+    Returns
+    -------
+    dict[tuple[int, int], np.ndarray]
+        The 1D histogram of parameter i is stored at (i, i). For j < i, the 2D
+        histogram of parameters i and j is stored at (i, j), with parameter i
+        binned along the first dimension.
+    """
+    if backend is None:
+        backend = _default_backend(samples)
+    elif backend not in _BACKENDS:
+        raise ValueError(f"Invalid backend: {backend}")
+
+    counts, installed = _BACKENDS[backend]
+    if not installed:
+        raise ImportError(f"The {backend} backend requires {backend} to be installed")
+
+    ndim = samples.shape[1]
+    keys = [(i, j) for i in range(ndim) for j in range(0 if pairs else i, i + 1)]
+    pdfs = counts(samples, bins, ranges, keys)
+
+    if density:
+        for (i, j), pdf in pdfs.items():
+            area = (ranges[i][1] - ranges[i][0]) / bins[i]
+            if i != j:
+                area *= (ranges[j][1] - ranges[j][0]) / bins[j]
+            pdf /= pdf.sum() * area
+
+    return pdfs
+
+
+def _default_backend(samples: np.ndarray) -> str:
+    """Pick the fastest installed histogram backend for the given samples.
+
+    Large inputs are histogrammed on the GPU if cupy is installed and a CUDA
+    device is available, or else by
+    numba, which fills all the histograms at once with a parallel kernel.
+    Otherwise, boost-histogram fills each histogram with multiple threads if more
+    than one CPU is available, and fast-histogram is used otherwise since the
+    bins are always uniform. numpy is always available as a fallback.
+
+    Parameters
+    ----------
+    samples : np.ndarray
+        Samples of shape (nsamples, ndim)
+
+    Returns
+    -------
+    str
+        Name of the backend
+    """
+    if cupy is not None and samples.nbytes > _CUPY_MIN_BYTES and _has_gpu():
+        return "cupy"
+    if _BACKENDS["numba"][1] and samples.nbytes > _NUMBA_MIN_BYTES:
+        return "numba"
+    if boost_histogram is not None and (os.cpu_count() or 1) > 1:
+        return "boost-histogram"
+    if histogram2d is not None:
+        return "fast-histogram"
+    return "numpy"
+
+
+def _has_gpu() -> bool:
+    """Check whether cupy can use a CUDA device.
+
+    cupy can be installed on machines without a GPU (or a working driver), in
+    which case it fails as soon as it is used.
+
+    Returns
+    -------
+    bool
+        True if at least one CUDA device is available
+    """
+    try:
+        return cupy.cuda.runtime.getDeviceCount() > 0
+    except (cupy.cuda.runtime.CUDARuntimeError, RuntimeError):
+        return False
+
+
+def _counts_numba(
+    samples: np.ndarray,
+    bins: Sequence[int],
+    ranges: Sequence[tuple[float, float]],
+    keys: Sequence[tuple[int, int]],
+) -> dict[tuple[int, int], np.ndarray]:
+    """Count samples with a parallel numba kernel; see `_histograms`."""
+    from ._hist_numba import corner_counts
+
+    # The kernel is compiled for both single and double precision samples, so
+    # only other dtypes need to be converted.
+    if samples.dtype not in [np.float32, np.float64]:
+        samples = samples.astype(np.float64)
+
+    bins = np.asarray(bins, dtype=np.int64)
+    lower, upper = np.asarray(ranges, dtype=np.float64).T
+    rows, cols = np.array(keys, dtype=np.int64).T
+    counts = corner_counts(samples, lower, upper, bins, rows, cols)
+    return {key: c.astype(np.float64) for key, c in zip(keys, counts, strict=True)}
+
+
+def _counts_boost_histogram(
+    samples: np.ndarray,
+    bins: Sequence[int],
+    ranges: Sequence[tuple[float, float]],
+    keys: Sequence[tuple[int, int]],
+) -> dict[tuple[int, int], np.ndarray]:
+    """Count samples with boost-histogram on every CPU; see `_histograms`.
+
+    Without an overflow bin, boost-histogram includes the upper bound in the
+    last bin, like np.histogram.
+    """
+    axes = [
+        boost_histogram.axis.Regular(
+            int(bins[i]), lower, upper, underflow=False, overflow=False
+        )
+        for i, (lower, upper) in enumerate(ranges)
+    ]
+
+    pdfs = {}
+    for i, j in keys:
+        params = [i] if i == j else [i, j]
+        hist = boost_histogram.Histogram(*(axes[k] for k in params))
+        hist.fill(*(samples[:, k] for k in params), threads=os.cpu_count())
+        pdfs[i, j] = hist.view()
+    return pdfs
+
+
+def _counts_fast_histogram(
+    samples: np.ndarray,
+    bins: Sequence[int],
+    ranges: Sequence[tuple[float, float]],
+    keys: Sequence[tuple[int, int]],
+) -> dict[tuple[int, int], np.ndarray]:
+    """Count samples with fast-histogram; see `_histograms`.
+
+    fast-histogram releases the GIL, so the histograms are filled in parallel
+    on a thread pool. It excludes the upper bound from the last bin, so those
+    samples are counted separately.
+    """
+
+    def count(key: tuple[int, int]) -> np.ndarray:
+        i, j = key
+        if i == j:
+            return histogram1d(samples[:, i], bins=int(bins[i]), range=ranges[i])
+        return histogram2d(
+            samples[:, i],
+            samples[:, j],
+            bins=(int(bins[i]), int(bins[j])),
+            range=(ranges[i], ranges[j]),
+        )
+
+    with ThreadPoolExecutor() as pool:
+        pdfs = dict(zip(keys, pool.map(count, keys), strict=True))
+
+    _count_upper_bounds(pdfs, samples, bins, ranges)
+    return pdfs
+
+
+def _count_upper_bounds(
+    pdfs: dict[tuple[int, int], np.ndarray],
+    samples: np.ndarray,
+    bins: Sequence[int],
+    ranges: Sequence[tuple[float, float]],
+) -> None:
+    """Add samples lying exactly on the upper bound of a range to the last bin.
+
+    np.histogram includes the upper bound in the last bin, but fast-histogram
+    treats it as out of range. Only the few samples on an upper bound are
+    binned again here, with np.histogram.
+
+    Parameters
+    ----------
+    pdfs : dict[tuple[int, int], np.ndarray]
+        Counts computed without the samples on the upper bounds; see
+        `_histograms`. Updated in place.
+    samples : np.ndarray
+        Samples of shape (nsamples, ndim)
+    bins : Sequence[int]
+        Number of bins for each parameter
+    ranges : Sequence[tuple[float, float]]
+        (min, max) of the histogram range for each parameter
+    """
+    ndim = samples.shape[1]
+    on_upper = [np.flatnonzero(samples[:, k] == ranges[k][1]) for k in range(ndim)]
+
+    for (i, j), pdf in pdfs.items():
+        if i == j:
+            pdf[-1] += len(on_upper[i])
+            continue
+
+        # Samples on the upper bound of i go in the last row, binned along j
+        # (including those also on the upper bound of j). The remaining samples
+        # on the upper bound of j go in the last column, binned along i.
+        row, _ = np.histogram(samples[on_upper[i], j], bins=bins[j], range=ranges[j])
+        only_j = np.setdiff1d(on_upper[j], on_upper[i], assume_unique=True)
+        col, _ = np.histogram(samples[only_j, i], bins=bins[i], range=ranges[i])
+        pdf[-1, :] += row
+        pdf[:, -1] += col
+
+
+def _counts_cupy(
+    samples: np.ndarray,
+    bins: Sequence[int],
+    ranges: Sequence[tuple[float, float]],
+    keys: Sequence[tuple[int, int]],
+) -> dict[tuple[int, int], np.ndarray]:
+    """Count samples on the GPU with cupy; see `_histograms`.
+
+    The samples are copied to the GPU once; only the histograms are copied
+    back.
+    """
+    device_samples = cupy.asarray(samples)
+
+    pdfs = {}
+    for i, j in keys:
+        if i == j:
+            counts, _ = cupy.histogram(
+                device_samples[:, i], bins=int(bins[i]), range=ranges[i]
+            )
+        else:
+            counts, _, _ = cupy.histogram2d(
+                device_samples[:, i],
+                device_samples[:, j],
+                bins=(int(bins[i]), int(bins[j])),
+                range=(ranges[i], ranges[j]),
+            )
+        pdfs[i, j] = cupy.asnumpy(counts).astype(np.float64)
+    return pdfs
+
+
+def _counts_numpy(
+    samples: np.ndarray,
+    bins: Sequence[int],
+    ranges: Sequence[tuple[float, float]],
+    keys: Sequence[tuple[int, int]],
+) -> dict[tuple[int, int], np.ndarray]:
+    """Count samples with np.bincount; see `_histograms`.
+
+    Each parameter is binned once up front, and every histogram is then a
+    single np.bincount over the precomputed bin indices rather than a separate
+    np.histogram2d call for each pair of parameters. When the 2D histograms
+    are computed, the 1D histograms are their marginal sums, which saves a
+    pass over the samples of each parameter.
+    """
+    ndim = samples.shape[1]
+    indices = [_digitize(samples[:, i], bins[i], ranges[i]) for i in range(ndim)]
+
+    # Out of range samples land in the overflow bin of each parameter, which is
+    # the last row/column of the counts and is discarded. Summing over the
+    # overflow bin too gives the marginal counts of the other parameter.
+    counts = {}
+    for i, j in keys:
+        if i != j:
+            shape = (bins[i] + 1, bins[j] + 1)
+            counts[i, j] = np.bincount(
+                indices[i] * shape[1] + indices[j], minlength=shape[0] * shape[1]
+            ).reshape(shape)
+
+    pdfs = {}
+    for i, j in keys:
+        if i != j:
+            hist = counts[i, j][:-1, :-1]
+        elif (i, 0) in counts:
+            hist = counts[i, 0].sum(axis=1)[:-1]
+        elif (1, i) in counts:
+            hist = counts[1, i].sum(axis=0)[:-1]
+        else:
+            hist = np.bincount(indices[i], minlength=bins[i] + 1)[:-1]
+        pdfs[i, j] = hist.astype(np.float64)
+    return pdfs
+
+
+# Function used to count the samples for each histogram backend, along with
+# whether the library it requires is installed
+_BACKENDS = {
+    "numba": (_counts_numba, importlib.util.find_spec("numba") is not None),
+    "boost-histogram": (_counts_boost_histogram, boost_histogram is not None),
+    "fast-histogram": (_counts_fast_histogram, histogram2d is not None),
+    "cupy": (_counts_cupy, cupy is not None),
+    "numpy": (_counts_numpy, True),
+}
+
+
+def _nice_bounds(
+    samplesx: np.ndarray, factor: float = 3
+) -> tuple[np.ndarray, np.ndarray]:
     """Generate sensible limits for distribution plots.
 
     Finds the mean+factor*std_dev and mean-factor*std_dev of a set of samples.
+    If the samples are 2D, the limits of each column are computed at once.
 
     Parameters
     ----------
     samplesx : {ndarray}
-        Samples from a distribution.
+        Samples from a distribution, of shape (nsamples,) or (nsamples, ndim).
     factor : {int}, optional
         Number of standard deviations to include (the default is 3, which
         usually gives nice looking plots without being too zoomed out)
@@ -286,10 +822,17 @@ def _nice_bounds(samplesx: np.ndarray, factor: float = 3) -> tuple[float, float]
     Returns
     -------
     tuple
-        (lower limit, upper limit) of plot.
+        (lower limit, upper limit) of plot; each is of shape (ndim,) for 2D
+        samples.
     """
-    sx = factor * np.std(samplesx)
-    avgx = np.mean(samplesx)
+    # np.std computes the mean internally, so computing both separately reads
+    # the samples three times. Compute the mean once and reuse it; einsum
+    # squares and sums the deviations without another temporary.
+    avgx = np.mean(samplesx, axis=0, dtype=np.float64)
+    deviation = samplesx - avgx
+    sx = factor * np.sqrt(
+        np.einsum("i...,i...->...", deviation, deviation) / len(deviation)
+    )
     return avgx - sx, avgx + sx
 
 
@@ -297,6 +840,7 @@ def walker_trace(
     fig: plt.Figure,
     samples: np.ndarray,
     labels: Sequence[str | None] | None = None,
+    downsample: bool = True,
     **kwargs: str | float,
 ) -> None:
     """Generate a walker trace figure from MCMC samples.
@@ -314,8 +858,17 @@ def walker_trace(
     labels : Sequence[str] | None
         List of length `ndim` containing variable names for each parameter.
         (the default is None, which means your parameters are unlabeled.)
+    downsample : bool
+        If True, traces with many more steps than the axes is wide in pixels
+        are reduced to the smallest and largest value of each walker in each
+        pixel column. This is much faster to draw, but is fixed at the size of
+        the figure when it is plotted, so zooming in or saving at a higher dpi
+        shows the reduced trace. Set to False to plot every step.
     **kwargs : dict
-        Line2D properties to pass to matplotlib
+        Line properties to pass to matplotlib. The walkers of each parameter
+        are drawn as one LineCollection, unless a property only applies to
+        Line2D (e.g. marker), in which case each walker is plotted as a
+        separate line, which is slower to draw.
     """
     nsteps, nwalkers, ndim = np.shape(samples)
 
@@ -333,7 +886,7 @@ def walker_trace(
     )
 
     if ndim == 1:
-        axes.plot(samples[:, :, 0], **kwargs)
+        _walker_lines(axes, samples[:, :, 0], downsample, **kwargs)
 
         axes.set_xlim(0, nsteps)
         if labels[0] is not None:
@@ -343,7 +896,7 @@ def walker_trace(
 
     else:
         for i in range(ndim):
-            axes[i].plot(samples[:, :, i], **kwargs)
+            _walker_lines(axes[i], samples[:, :, i], downsample, **kwargs)
             axes[i].set_xlim(0, nsteps)
             if labels[i] is not None:
                 axes[i].set_ylabel(labels[i])
@@ -352,4 +905,61 @@ def walker_trace(
 
         axes[ndim - 1].set_xlabel("Step")
 
-    return
+
+def _walker_lines(
+    ax: plt.Axes, samples: np.ndarray, downsample: bool = True, **kwargs: str | float
+) -> None:
+    """Plot the trace of every walker as a single LineCollection.
+
+    A separate Line2D for each walker makes drawing expensive when there are
+    many walkers; a single collection is drawn in one pass. If kwargs contains
+    properties that a LineCollection doesn't have (e.g. marker), each walker is
+    plotted as a Line2D instead. Long traces can be downsampled to the width of
+    the axes, keeping the smallest and largest value of each walker within each
+    pixel column.
+
+    Parameters
+    ----------
+    ax : plt.Axes
+        Axes instance to plot the traces on
+    samples : np.ndarray
+        Samples of a single parameter, of shape (nsteps, nwalkers)
+    downsample : bool
+        If True, downsample traces with many more steps than pixels
+    **kwargs : dict
+        LineCollection or Line2D properties to pass to matplotlib
+    """
+    nsteps, nwalkers = samples.shape
+    steps = np.broadcast_to(np.arange(nsteps)[:, np.newaxis], samples.shape)
+
+    # When there are many more steps than pixels, most segments are drawn on
+    # top of each other. Only the extremes of each pixel column are visible, so
+    # keep those (in order) and drop the rest.
+    size = nsteps // max(1, int(ax.get_window_extent().width))
+    if downsample and size > 2:
+        nbuckets = nsteps // size
+        buckets = samples[: nbuckets * size].reshape(nbuckets, size, nwalkers)
+        argmin = buckets.argmin(axis=1)
+        argmax = buckets.argmax(axis=1)
+        extremes = np.stack(
+            [np.minimum(argmin, argmax), np.maximum(argmin, argmax)], axis=1
+        )
+        extremes += size * np.arange(nbuckets)[:, np.newaxis, np.newaxis]
+        steps = np.concatenate(
+            [extremes.reshape(-1, nwalkers), steps[nbuckets * size :]]
+        )
+        samples = np.take_along_axis(samples, steps, axis=0)
+
+    if not all(hasattr(LineCollection, f"set_{key}") for key in kwargs):
+        ax.plot(steps, samples, **kwargs)
+        return
+
+    segments = np.empty((nwalkers, len(steps), 2))
+    segments[:, :, 0] = steps.T
+    segments[:, :, 1] = samples.T
+    # Finding the data limits of a collection means computing the extents of
+    # every path; the extremes of the (downsampled) samples give the same
+    # limits with a single vectorized min/max (NaN steps are skipped by both).
+    ax.add_collection(LineCollection(segments, **kwargs), autolim=False)
+    ax.update_datalim([(0, np.nanmin(samples)), (nsteps - 1, np.nanmax(samples))])
+    ax.autoscale_view()
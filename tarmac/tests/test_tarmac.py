@@ -1,3 +1,8 @@
+import pathlib
+import subprocess
+import sys
+import types
+
 import matplotlib.pyplot as plt
 import numpy as np
 import pytest
@@ -8,7 +13,7 @@ import tarmac
 @pytest.fixture(scope="module")
 def example_data():
     """Load example data for plotting."""
-    return np.load("extra_data.npy")
+    return np.load("extra_data.npy", mmap_mode="r")
 
 
 def test_corner_plot(example_data):
@@ -21,6 +26,116 @@ def test_corner_plot(example_data):
         cmap="viridis",
     )
 
+    # Only the diagonal and lower triangle of the grid are created
+    assert len(fig.axes) == 10
+
+
+def test_corner_plot_offset_labels(example_data):
+    """Test that tick label offsets are moved into the outer axis labels."""
+    fig = plt.figure(figsize=(10, 10))
+    tarmac.corner_plot(fig, example_data, labels=["a", "b", "c", "d"])
+
+    axes = {
+        (ax.get_subplotspec().rowspan.start, ax.get_subplotspec().colspan.start): ax
+        for ax in fig.axes
+    }
+    assert axes[3, 0].get_xlabel() == "a (1e\u221212)"
+    assert axes[3, 0].get_ylabel() == "d (1e\u22129)"
+    assert axes[2, 1].get_xlabel() == ""
+    assert axes[2, 1].get_ylabel() == ""
+
+    # Zooming out updates the label, even though the formatter is shared
+    axes[3, 0].set_xlim(0, 1)
+    assert axes[3, 0].get_xlabel() == "a"
+    assert axes[3, 0].get_ylabel() == "d (1e\u22129)"
+
+
+def test_corner_plot_fortran_order(example_data):
+    """Test that column-major samples give the same corner plot."""
+    images = []
+    for samples in [example_data, np.asfortranarray(example_data)]:
+        fig = plt.figure()
+        tarmac.corner_plot(fig, samples)
+        images.append([image.get_array() for ax in fig.axes for image in ax.images])
+
+    for c_image, fortran_image in zip(*images, strict=True):
+        np.testing.assert_allclose(c_image, fortran_image)
+
+    # Fortran-ordered samples aren't copied; other layouts are copied once,
+    # straight into column-major order
+    fortran = np.asfortranarray(example_data)
+    samples, *_ = tarmac.tarmac._validate_corner_args(
+        fortran, bins=10, ranges=None, labels=None
+    )
+    assert np.shares_memory(samples, fortran)
+    samples, *_ = tarmac.tarmac._validate_corner_args(
+        example_data[::2], bins=10, ranges=None, labels=None
+    )
+    assert samples.flags.f_contiguous
+
+
+def test_corner_plot_bins(example_data):
+    """Test that the number of bins can be given for each parameter."""
+    fig = plt.figure()
+    tarmac.corner_plot(fig, example_data, bins=[10, 20, 30, 40])
+
+    image = fig.axes[-2].images[0]
+    assert image.get_array().shape == (40, 30)
+
+    with pytest.raises(ValueError, match="Dimension mismatch between bins"):
+        tarmac.corner_plot(plt.figure(), example_data, bins=[10, 20])
+
+    with pytest.raises(ValueError, match="Dimension mismatch between bins"):
+        tarmac.corner_plot(plt.figure(), example_data, bins=np.full((4, 2), 10))
+
+    for bins in (20.7, 0, -1, [10, 20, 30.5, 40], [10, 0, 30, 40]):
+        with pytest.raises(ValueError, match="bins must be positive integers"):
+            tarmac.corner_plot(plt.figure(), example_data, bins=bins)
+
+    fig = plt.figure()
+    tarmac.corner_plot(fig, example_data, bins=20.0)
+    assert fig.axes[-2].images[0].get_array().shape == (20, 20)
+    plt.close("all")
+
+
+def test_corner_plot_shared_norm(example_data):
+    """Test that the 2D histograms can share a single color scale."""
+    fig = plt.figure()
+    tarmac.corner_plot(fig, example_data, shared_norm=True)
+
+    images = [image for ax in fig.axes for image in ax.images]
+    assert len(images) == 6
+    assert all(image.norm is images[0].norm for image in images)
+    assert images[0].norm.vmin == 0
+    assert images[0].norm.vmax == max(image.get_array().max() for image in images)
+
+
+def test_corner_plot_max_samples(example_data):
+    """Test that large inputs are thinned to at most max_samples samples."""
+    samples, *_ = tarmac.tarmac._validate_corner_args(
+        example_data, bins=10, ranges=None, labels=None, max_samples=3000
+    )
+    assert len(samples) <= 3000
+    assert samples.flags.f_contiguous
+
+    # Every 7th step of all walkers is kept, regardless of the memory layout
+    expected = np.sort(example_data[::7].reshape(-1, 4), axis=0)
+    np.testing.assert_array_equal(np.sort(samples, axis=0), expected)
+    samples, *_ = tarmac.tarmac._validate_corner_args(
+        np.asfortranarray(example_data),
+        bins=10,
+        ranges=None,
+        labels=None,
+        max_samples=3000,
+    )
+    np.testing.assert_array_equal(np.sort(samples, axis=0), expected)
+
+    fig = plt.figure()
+    tarmac.corner_plot(fig, example_data, max_samples=3000)
+
+    with pytest.raises(ValueError, match="max_samples must be at least 1"):
+        tarmac.corner_plot(plt.figure(), example_data, max_samples=0)
+
 
 def test_walker_trace(example_data):
     """Test that a walker trace can be constructed."""
@@ -30,3 +145,195 @@ def test_walker_trace(example_data):
         example_data,
         labels=["a", "b", "c", "d"],
     )
+
+
+@pytest.mark.parametrize("data", ["normal", "integer"])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+@pytest.mark.parametrize(
+    "backend", ["numba", "boost-histogram", "fast-histogram", "cupy", "numpy"]
+)
+def test_histograms_match_numpy(backend, dtype, data):
+    """Test that the corner plot histograms agree with numpy's implementation."""
+    if backend != "numpy":
+        pytest.importorskip(backend.replace("-", "_"))
+
+    rng = np.random.default_rng(0)
+    if data == "normal":
+        samples = rng.normal(size=(10000, 2)).astype(dtype)
+        bins = [20, 30]
+        ranges = [(-3.5, 3.5), (-2.5, 2.5)]
+    else:
+        # Integer values lie exactly on the bin edges
+        samples = rng.integers(-1, 12, size=(10000, 2)).astype(dtype)
+        bins = [10, 5]
+        ranges = [(0, 10), (0, 5)]
+
+    # np.histogram counts samples on the upper bound in the last bin
+    samples[:100, 0] = ranges[0][1]
+    samples[50:150, 1] = ranges[1][1]
+
+    pdfs = tarmac.tarmac._histograms(samples, bins=bins, ranges=ranges, backend=backend)
+
+    for i in range(2):
+        expected, _ = np.histogram(
+            samples[:, i], bins=bins[i], range=ranges[i], density=True
+        )
+        np.testing.assert_allclose(pdfs[i, i], expected, rtol=1e-6)
+
+    expected, _, _ = np.histogram2d(
+        samples[:, 1],
+        samples[:, 0],
+        bins=[bins[1], bins[0]],
+        range=[ranges[1], ranges[0]],
+        density=True,
+    )
+    np.testing.assert_allclose(pdfs[1, 0], expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize(
+    "backend", ["numba", "boost-histogram", "fast-histogram", "cupy", "numpy"]
+)
+def test_corner_plot_constant_parameter(example_data, backend):
+    """Test that a parameter with a constant value is plotted, like np.histogram."""
+    if backend != "numpy":
+        pytest.importorskip(backend.replace("-", "_"))
+
+    samples = np.array(example_data)
+    samples[..., 2] = 0.1
+
+    _, _, ranges, limits, _ = tarmac.tarmac._validate_corner_args(
+        samples, bins=10, ranges=[None, None, None, (1, 1)], labels=None
+    )
+    np.testing.assert_allclose(ranges[2], [-0.4, 0.6])
+    np.testing.assert_allclose(limits[2], [-0.4, 0.6])
+    np.testing.assert_allclose(ranges[3], [0.5, 1.5])
+
+    fig = plt.figure()
+    tarmac.corner_plot(fig, samples, backend=backend)
+
+
+def test_corner_plot_narrow_parameter():
+    """Test that a narrow distribution far from zero isn't treated as constant."""
+    rng = np.random.default_rng(0)
+    samples = 1e5 + 1e-6 * rng.normal(size=(1000, 10, 2))
+    samples[..., 1] = 1 + 1e-11 * rng.normal(size=(1000, 10))
+
+    _, _, ranges, limits, _ = tarmac.tarmac._validate_corner_args(
+        samples, bins=10, ranges=None, labels=None
+    )
+    np.testing.assert_allclose(limits[0] - 1e5, [-3e-6, 3e-6], rtol=0.05)
+    np.testing.assert_allclose(limits[1] - 1, [-3e-11, 3e-11], rtol=0.05)
+    np.testing.assert_array_equal(ranges, limits)
+
+
+def test_nice_bounds():
+    """Test that the plot limits of every column match numpy's mean and std."""
+    rng = np.random.default_rng(0)
+    samples = rng.normal(loc=[1, -5, 1e3], scale=[1, 0.1, 20], size=(10000, 3))
+
+    lower, upper = tarmac.tarmac._nice_bounds(samples)
+    np.testing.assert_allclose(lower, samples.mean(axis=0) - 3 * samples.std(axis=0))
+    np.testing.assert_allclose(upper, samples.mean(axis=0) + 3 * samples.std(axis=0))
+
+    lower, upper = tarmac.tarmac._nice_bounds(samples[:, 1])
+    assert np.isclose(lower, samples[:, 1].mean() - 3 * samples[:, 1].std())
+    assert np.isclose(upper, samples[:, 1].mean() + 3 * samples[:, 1].std())
+
+
+def test_walker_trace_line_properties(example_data):
+    """Test that Line2D-only properties plot each walker as a separate line."""
+    fig = plt.figure()
+    tarmac.walker_trace(fig, example_data, marker=".")
+
+    lines = fig.axes[0].lines
+    assert len(lines) == example_data.shape[1]
+    assert all(line.get_marker() == "." for line in lines)
+    assert not fig.axes[0].collections
+
+
+def test_walker_trace_downsampling():
+    """Test that long traces are downsampled without losing their extremes."""
+    rng = np.random.default_rng(0)
+    samples = rng.normal(size=(100000, 3, 1))
+
+    fig = plt.figure()
+    tarmac.walker_trace(fig, samples)
+
+    (collection,) = fig.axes[0].collections
+    segments = collection.get_segments()
+    assert len(segments) == 3
+    for segment, walker in zip(segments, samples[:, :, 0].T, strict=True):
+        assert len(segment) < len(walker)
+        assert np.all(np.diff(segment[:, 0]) > 0)
+        assert segment[:, 1].min() == walker.min()
+        assert segment[:, 1].max() == walker.max()
+
+    fig = plt.figure()
+    tarmac.walker_trace(fig, samples, downsample=False)
+
+    (collection,) = fig.axes[0].collections
+    for segment, walker in zip(
+        collection.get_segments(), samples[:, :, 0].T, strict=True
+    ):
+        np.testing.assert_array_equal(segment[:, 1], walker)
+
+
+def test_default_backend(example_data):
+    """Test that numba isn't imported or used for small inputs."""
+    code = "import sys, tarmac; assert 'numba' not in sys.modules"
+    root = pathlib.Path(tarmac.__file__).parents[1]
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=root)
+
+    samples = np.asarray(example_data).reshape(-1, 4)
+    assert tarmac.tarmac._default_backend(samples) != "numba"
+
+
+def test_cupy_backend(example_data, monkeypatch):
+    """Test the cupy backend, with numpy standing in for cupy."""
+
+    class CUDARuntimeError(RuntimeError):
+        pass
+
+    ndevices = 1
+
+    def get_device_count() -> int:
+        if ndevices == 0:
+            raise CUDARuntimeError("no CUDA-capable device is detected")
+        return ndevices
+
+    runtime = types.SimpleNamespace(
+        getDeviceCount=get_device_count, CUDARuntimeError=CUDARuntimeError
+    )
+    fake_cupy = types.SimpleNamespace(
+        asarray=np.asarray,
+        asnumpy=np.asarray,
+        histogram=np.histogram,
+        histogram2d=np.histogram2d,
+        cuda=types.SimpleNamespace(runtime=runtime),
+    )
+    monkeypatch.setattr(tarmac.tarmac, "cupy", fake_cupy)
+    monkeypatch.setattr(tarmac.tarmac, "_CUPY_MIN_BYTES", 0)
+    monkeypatch.setitem(
+        tarmac.tarmac._BACKENDS, "cupy", (tarmac.tarmac._counts_cupy, True)
+    )
+
+    samples = np.asarray(example_data).reshape(-1, 4)
+    assert tarmac.tarmac._default_backend(samples) == "cupy"
+
+    bins = [10, 20, 30, 40]
+    ranges = np.column_stack(tarmac.tarmac._nice_bounds(samples))
+    pdfs = tarmac.tarmac._histograms(samples, bins, ranges, backend="cupy")
+    expected = tarmac.tarmac._histograms(samples, bins, ranges, backend="numpy")
+    for key, pdf in expected.items():
+        np.testing.assert_allclose(pdfs[key], pdf)
+
+    # Without a usable device, a CPU backend is picked instead
+    ndevices = 0
+    assert tarmac.tarmac._default_backend(samples) != "cupy"
+
+
+def test_invalid_backend(example_data):
+    """Test that an unknown histogram backend is rejected."""
+    fig = plt.figure()
+    with pytest.raises(ValueError, match="Invalid backend"):
+        tarmac.corner_plot(fig, example_data, backend="unknown")